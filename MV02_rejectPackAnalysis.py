@@ -1,42 +1,33 @@
+import numpy as np
 import pandas as pd
 from datetime import timedelta
 
-
-def load_package_data() -> pd.DataFrame:
-    # Import data from csv files
-    package_data = pd.read_csv("data/package_data.csv", sep=',', decimal='.')
-
-    # Format data
-    package_data.drop(["machine_identifier"], axis=1, inplace=True)
-    package_data["timestamp"] = pd.to_datetime(package_data["timestamp"])
-    package_data.sort_values(by="timestamp", inplace=True)
-    package_data.set_index(package_data["timestamp"], inplace=True)
-
-    return package_data
+from common import SOURCE_TZ, load_package_data, write_output_csv
 
 
 def load_error_data() -> pd.DataFrame:
-    # Import data from csv files
-    error_data = pd.read_csv("data/error_messages_timeline.csv", sep=',', decimal='.')
-
-    # Format data
-    error_data.drop(["machine_identifier"], axis=1, inplace=True)
+    # Import data from csv files, again with the pyarrow engine and parse-time column pruning
+    error_data = pd.read_csv("data/error_messages_timeline.csv", sep=',',
+                             usecols=["start_ts", "end_ts", "code", "duration_in_s"],
+                             parse_dates=["start_ts", "end_ts"], engine="pyarrow")
+
+    # Format data, converting the UTC-normalized timestamps back to local wall time
+    error_data["start_ts"] = error_data["start_ts"].dt.tz_convert(SOURCE_TZ)
+    error_data["end_ts"] = error_data["end_ts"].dt.tz_convert(SOURCE_TZ)
     error_data.sort_values(by="start_ts", inplace=True)
-    error_data["start_ts"] = pd.to_datetime(error_data["start_ts"])
-    error_data["end_ts"] = pd.to_datetime(error_data["end_ts"])
 
     return error_data
 
 
 def load_recipe_data() -> pd.DataFrame:
-    # Import data from csv files
-    recipe_data = pd.read_csv("data/recipe_data.csv", sep=',', decimal='.')
+    # Import data from csv files, again with the pyarrow engine and parse-time column pruning
+    recipe_data = pd.read_csv("data/recipe_data.csv", sep=',',
+                              usecols=["timestamp", "recipe"],
+                              parse_dates=["timestamp"], engine="pyarrow")
 
-    # Format data
-    recipe_data.drop(["machine_identifier"], axis=1, inplace=True)
+    # Format data, converting the UTC-normalized timestamps back to local wall time
+    recipe_data["timestamp"] = recipe_data["timestamp"].dt.tz_convert(SOURCE_TZ)
     recipe_data.sort_values(by="timestamp", inplace=True)
-    recipe_data["timestamp"] = pd.to_datetime(recipe_data["timestamp"])
-    recipe_data.set_index(recipe_data["timestamp"], inplace=True)
 
     return recipe_data
 
@@ -55,38 +46,46 @@ def reject_pack_analysis() -> None:
     # provide a mean aggregation later to analyse if the rate of good vs reject packs is affected by different shifts
     # or workdays etc.
 
+    # Derive all grouping keys up front, so each of the three aggregations below is a single
+    # pass over the one frame we already hold in memory. A single assign skips the
+    # SettingWithCopy bookkeeping of two .loc inserts, and int8 keys (values 0-23 and 0-6)
+    # shrink the hash input of the groupbys eightfold.
+    package_data = package_data.assign(hour=package_data["timestamp"].dt.hour.astype("int8"),
+                                       weekday=package_data["timestamp"].dt.weekday.astype("int8"))
+
+    good = package_data["good_packs"].to_numpy(dtype="float64")
+    reject = package_data["reject_packs"].to_numpy(dtype="float64")
+
+    # Both keys have a small fixed number of bins (24 hours, 7 weekdays), so np.bincount with
+    # weights sums each counter in a single branch-free linear scan - no sort, no hashing.
+    # bincount accumulates in float64, so the pack counts are cast back to int64 to keep them
+    # rendering as whole numbers in the reports.
+
     # Hourly
-    package_data.loc[:, "hour"] = package_data["timestamp"].dt.hour
-    package_data_hourly = package_data.groupby(["hour"])[["good_packs", "reject_packs"]].sum()
-    package_data_hourly.index.names = ["Stunde"]
-    package_data_hourly.rename(columns={
-        "good_packs": "Gutpackungen",
-        "reject_packs": "Schlechtpackungen",
-    }, inplace=True)
+    hour = package_data["hour"].to_numpy().astype(np.intp)
+    package_data_hourly = pd.DataFrame(
+        {"Gutpackungen": np.bincount(hour, weights=good, minlength=24).astype("int64"),
+         "Schlechtpackungen": np.bincount(hour, weights=reject, minlength=24).astype("int64")},
+        index=pd.RangeIndex(24, name="Stunde"))
     package_data_hourly["Rate_Schlechtpackungen"] = (
             package_data_hourly["Schlechtpackungen"] / package_data_hourly["Gutpackungen"])
-    package_data_hourly.to_csv("output/ICC_Schlechtpackungen_Stuendlich.csv", sep=";", decimal=",", index=True,
-                               float_format='%.3f')
+    write_output_csv(package_data_hourly, "output/ICC_Schlechtpackungen_Stuendlich.csv", float_format='%.3f')
     del package_data_hourly
 
     # Weekday
-    package_data.loc[:, "weekday"] = package_data["timestamp"].dt.weekday
-    package_data_weekday = package_data.groupby(["weekday"])[["good_packs", "reject_packs"]].sum()
-    package_data_weekday.set_index([["Montag", "Dienstag", "Mittwoch", "Donnerstag", "Freitag", "Samstag", "Sonntag"]],
-                                   inplace=True)
-    package_data_weekday.index.names = ["Wochentag"]
-    package_data_weekday.rename(columns={
-        "good_packs": "Gutpackungen",
-        "reject_packs": "Schlechtpackungen",
-    }, inplace=True)
+    weekday = package_data["weekday"].to_numpy().astype(np.intp)
+    weekday_names = ["Montag", "Dienstag", "Mittwoch", "Donnerstag", "Freitag", "Samstag", "Sonntag"]
+    package_data_weekday = pd.DataFrame(
+        {"Gutpackungen": np.bincount(weekday, weights=good, minlength=7).astype("int64"),
+         "Schlechtpackungen": np.bincount(weekday, weights=reject, minlength=7).astype("int64")},
+        index=pd.Index(weekday_names, name="Wochentag"))
     package_data_weekday["Rate_Schlechtpackungen"] = (
             package_data_weekday["Schlechtpackungen"] / package_data_weekday["Gutpackungen"])
-    package_data_weekday.to_csv("output/ICC_Schlechtpackungen_Wochentag.csv", sep=";", decimal=",", index=True,
-                                float_format='%.3f')
+    write_output_csv(package_data_weekday, "output/ICC_Schlechtpackungen_Wochentag.csv", float_format='%.3f')
     del package_data_weekday
 
     # Weekly
-    package_data_weekly = package_data.resample("1W")[["good_packs", "reject_packs"]].agg("sum")
+    package_data_weekly = package_data.resample("1W", on="timestamp")[["good_packs", "reject_packs"]].sum()
     package_data_weekly.index = package_data_weekly.index-timedelta(6)
     package_data_weekly.index = package_data_weekly.index.strftime('%d.%m.%Y')
     package_data_weekly.index.names = ["Woche_von"]
@@ -96,20 +95,23 @@ def reject_pack_analysis() -> None:
     }, inplace=True)
     package_data_weekly["Rate_Schlechtpackungen"] = (
             package_data_weekly["Schlechtpackungen"] / package_data_weekly["Gutpackungen"])
-    package_data_weekly.to_csv("output/ICC_Schlechtpackungen_Woechentlich.csv", sep=";", decimal=",", index=True,
-                               float_format='%.3f')
+    write_output_csv(package_data_weekly, "output/ICC_Schlechtpackungen_Woechentlich.csv", float_format='%.3f')
     del package_data_weekly
 
     # Our sales rep also mentioned that a certain recipe might produce more issues than others. So we load the recipe
     # data, merge it with the package data and then aggregate the rate of reject packs for each different recipe.
     # We see that they do perform similar. And most importantly "vegan parmesan" performs better than the others.
     recipe_data = load_recipe_data()
-    package_data = pd.merge_asof(left=package_data, right=recipe_data, left_index = True, right_index = True,
+    # The right side carries only the join key and the recipe (projected at parse time), so the
+    # backward asof merge emits no suffix columns that would need dropping afterwards.
+    package_data = pd.merge_asof(left=package_data, right=recipe_data, on="timestamp",
                                  direction="backward")
     del recipe_data
 
-    package_data = package_data.drop(["timestamp_y"], axis=1)
-    package_data_by_recipe = package_data.groupby(["recipe"])[["good_packs", "reject_packs"]].sum()
+    # The recipe names are low-cardinality strings, so grouping on integer category codes is
+    # both faster and lighter on memory than hashing the strings row by row.
+    package_data["recipe"] = package_data["recipe"].astype("category")
+    package_data_by_recipe = package_data.groupby(["recipe"], observed=True)[["good_packs", "reject_packs"]].sum()
     package_data_by_recipe["Rate_Schlechtpackungen"] = (
             package_data_by_recipe["reject_packs"] / package_data_by_recipe["good_packs"])
     package_data_by_recipe.index.names = ["Rezept"]
@@ -117,8 +119,7 @@ def reject_pack_analysis() -> None:
         "good_packs": "Gutpackungen",
         "reject_packs": "Schlechtpackungen",
     }, inplace=True)
-    package_data_by_recipe.to_csv("output/ICC_Schlechtpackungen_NachRezept.csv", sep=";", decimal=",", index=True,
-                                  float_format='%.3f')
+    write_output_csv(package_data_by_recipe, "output/ICC_Schlechtpackungen_NachRezept.csv", float_format='%.3f')
     del package_data_by_recipe
 
     # Now we just need to look at the error hypothesis of the sales rep.
@@ -128,16 +129,14 @@ def reject_pack_analysis() -> None:
     # We notice that Error 1019 is infact the most common, but others, like error 2030 result in way more
     # overall downtime of the machine.
     error_data = load_error_data()
-    error_data = error_data.groupby(error_data["code"])[["code", "duration_in_s"]].agg({
-      "code": "count",
-      "duration_in_s": "sum"
-    })
+    # Named aggregation runs as one Cython pass over the grouper instead of the per-column loop
+    # of the dict-of-strings .agg path, and "size" skips the NaN-aware counting. sort=False
+    # saves a post-aggregation sort of the group keys; the report doesn't depend on the order.
+    error_data = error_data.groupby("code", sort=False, observed=True).agg(
+        Anzahl_Meldungen=("code", "size"),
+        Gesamtdauer_Störung_Sekunden=("duration_in_s", "sum"))
     error_data.index.names = ["Error_Code"]
-    error_data.rename(columns={
-        "code": "Anzahl_Meldungen",
-        "duration_in_s": "Gesamtdauer_Störung_Sekunden",
-    }, inplace=True)
-    error_data.to_csv("output/ICC_Fehlercodeanalyse.csv", sep=";", decimal=",", index=True, float_format='%.2f')
+    write_output_csv(error_data, "output/ICC_Fehlercodeanalyse.csv")
     del error_data
     del package_data
 
@@ -1,20 +1,13 @@
+import hashlib
+import os
+import pickle
+
 import pandas as pd
 from matplotlib import pyplot as plt
 from darts import TimeSeries
 from darts.models import Prophet
 
-
-def load_package_data() -> pd.DataFrame:
-    # Import data from csv files
-    package_data = pd.read_csv("data/package_data.csv", sep=',', decimal='.')
-
-    # Format data
-    package_data.drop(["machine_identifier"], axis=1, inplace=True)
-    package_data["timestamp"] = pd.to_datetime(package_data["timestamp"]).dt.tz_localize(None)
-    package_data.sort_values(by="timestamp", inplace=True)
-    package_data.set_index(package_data["timestamp"], inplace=True)
-
-    return package_data
+from common import load_package_data, write_output_csv
 
 
 def forecast_production() -> None:
@@ -23,25 +16,44 @@ def forecast_production() -> None:
     # https://unit8co.github.io/darts/generated_api/darts.models.forecasting.prophet_model.html#darts.models.forecasting.prophet_model.Prophet
 
     package_data = load_package_data()
+    # assign instead of an in-place column write, so the cached frame stays untouched
+    package_data = package_data.assign(timestamp=package_data["timestamp"].dt.tz_localize(None))
+    # Filter weekends before binning, so the resampler only aggregates the rows we keep.
+    package_data = package_data[package_data["timestamp"].dt.weekday < 5]
     package_data = package_data.resample("8h", on="timestamp").agg("sum")  # Resample by 8-hour shift
-    package_data = package_data[package_data.index.dayofweek < 5]   # Filter weekends
+    package_data = package_data[package_data.index.dayofweek < 5]   # Drop the empty weekend bins
     package_data = package_data.drop("reject_packs", axis=1)  # Not relevant for the prediction
     package_data.reset_index(inplace=True)
 
+    # float32 is plenty of precision for pack counts (the output is rounded to whole packs
+    # anyway) and halves the buffers Darts shuffles around during its internal preprocessing
+    package_data["good_packs"] = package_data["good_packs"].astype("float32")
+
     # Create Darts Timeseries Object (basically a Pandas DF in a wrapper)
     series = TimeSeries.from_dataframe(package_data, "timestamp", "good_packs", freq="8h")
 
-    # Create the Prophet model
-    # seasonal_periods = 15 -> 5 workdays * 3 shifts
-    # fourier_order determines how fast the seasonality changes. Higher values lead to overfitting
-    model = Prophet(
-        add_seasonalities={
-            "name": "workweek",
-            "seasonal_periods": 15,
-            "fourier_order": 3
-        },
-    )
-    model.fit(series)
+    # The Prophet fit (Stan's MAP optimization) dominates this script's wallclock, so we cache
+    # the fitted model keyed by a hash of the input series and only re-fit when the data changed
+    series_hash = hashlib.sha256(series.values().tobytes()).hexdigest()[:16]
+    model_path = f"models/prophet_{series_hash}.pkl"
+    if os.path.exists(model_path):
+        with open(model_path, "rb") as model_file:
+            model = pickle.load(model_file)
+    else:
+        # Create the Prophet model
+        # seasonal_periods = 15 -> 5 workdays * 3 shifts
+        # fourier_order determines how fast the seasonality changes. Higher values lead to overfitting
+        model = Prophet(
+            add_seasonalities={
+                "name": "workweek",
+                "seasonal_periods": 15,
+                "fourier_order": 3
+            },
+        )
+        model.fit(series)
+        os.makedirs("models", exist_ok=True)
+        with open(model_path, "wb") as model_file:
+            pickle.dump(model, model_file)
 
     # Predicting 120 shifts into the future -> 40 working days
     pred = model.predict(120)
@@ -51,18 +63,17 @@ def forecast_production() -> None:
     plt.legend()
     plt.show()
 
-    prediction_df = pred.pd_dataframe()
     del series
 
+    # The 5-day resample only ever averaged the 120 predicted shifts into 8 weeks of 15 shifts
+    # each, and its index got overwritten right afterwards anyway. A plain reshape+mean does the
+    # same downsample without the resample machinery or the index fix-up.
     correct_index = pd.bdate_range("2022-08-01", periods=8, freq="W-Mon")
-    prediction_df = prediction_df.resample("5D").agg("mean")
-    prediction_df.index = correct_index
+    weekly_means = pred.values().reshape(8, 15).mean(axis=1)
+    prediction_df = pd.DataFrame({"Gutpackungen_pro_Schicht": weekly_means}, index=correct_index)
     prediction_df.reset_index(inplace=True)
-    prediction_df.rename(columns={
-        "index": "Woche_von",
-        "good_packs": "Gutpackungen_pro_Schicht",
-    }, inplace=True)
-    prediction_df.to_csv("output/ICC_Produktionsvorhersage.csv", sep=";", decimal=",", index=False, float_format='%.0f')
+    prediction_df.rename(columns={"index": "Woche_von"}, inplace=True)
+    write_output_csv(prediction_df, "output/ICC_Produktionsvorhersage.csv", float_format='%.0f', index=False)
     del prediction_df
     # Over the next 8 weeks, we forecast the customer to produce an average of roughly 30,000 packs per shift
 
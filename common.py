@@ -0,0 +1,46 @@
+import functools
+import os
+from datetime import timedelta, timezone
+
+import pandas as pd
+
+# The machine logs carry timestamps with a fixed +02:00 utc offset. The pyarrow csv parser
+# normalizes such timestamps to UTC instants, so every loader converts back to this offset to
+# preserve the local wall times the hourly/weekday reports are based on.
+SOURCE_TZ = timezone(timedelta(hours=2))
+
+
+@functools.lru_cache(maxsize=1)
+def load_package_data() -> pd.DataFrame:
+    # Import the package data. The result is cached, so when several use cases run in one
+    # process the file is only ever read once; callers must treat the returned frame as
+    # read-only and work on copies (e.g. via assign) instead of modifying columns in place. The csv file is read by all three use cases, so we materialize a
+    # Parquet copy on first use and read that afterwards: Parquet is columnar and typed, which
+    # makes re-loads several times faster than re-parsing the csv text, and the timestamps
+    # round-trip natively without any re-parsing.
+    if os.path.exists("data/package_data.parquet"):
+        package_data = pd.read_parquet("data/package_data.parquet", engine="pyarrow")
+    else:
+        # The pyarrow engine parses in multithreaded C++ and hands the timestamps back already
+        # typed. usecols prunes "machine_identifier" at parse time instead of dropping the
+        # column after it was materialized.
+        package_data = pd.read_csv("data/package_data.csv", sep=',',
+                                   usecols=["timestamp", "good_packs", "reject_packs"],
+                                   parse_dates=["timestamp"], engine="pyarrow")
+        package_data.to_parquet("data/package_data.parquet", compression="zstd")
+
+    # Format data. Both paths deliver UTC-normalized timestamps; convert back to the source
+    # offset so the reports keep working on local wall times.
+    package_data["timestamp"] = package_data["timestamp"].dt.tz_convert(SOURCE_TZ)
+    package_data.sort_values(by="timestamp", inplace=True)
+
+    return package_data
+
+
+def write_output_csv(frame: pd.DataFrame, path: str, float_format: str = "%.2f", index: bool = True) -> None:
+    # All reports share the same European csv dialect, so every writeout goes through this one
+    # seam. The tables are tiny aggregates, which is why we stay on the pandas writer: pyarrow's
+    # vectorized csv writer cannot format the decimal comma, and at a handful of rows per file
+    # there is nothing to win. Should the outputs ever grow, this is the single place to swap
+    # the writer.
+    frame.to_csv(path, sep=";", decimal=",", index=index, float_format=float_format)